@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 
+import os
 import sys
-from enum import Enum
+from array import array
+from collections import deque
+from functools import partial
+from enum import IntEnum
 from typing import List, Optional
 import re
 
@@ -22,11 +26,38 @@ import re
 各个字符的具体定义可查看 https://www.runoob.com/regexp/regexp-metachar.html 
 """
 
+# 一行状态转移规则：源状态->目的状态，空格之后是用空格分隔的若干个转移字母
+_RULE_RE = re.compile(r"(\d+)->(\d+) (.*)")
+# 一个转移字母及其后的分隔空格。依次尝试：\x形式的特殊字符或ε（第1组），a-z形式的区间（第2、3组），单个字母（第4组，可以是空格）
+_TOKEN_RE = re.compile(r"(?:\\([^ ])|([^ ])-([^ ])|(.))(?: |\Z)")
 
-class RuleType(Enum):
+# 特殊字符的查找表：下标为字符的编码，值为1表示属于该类。定义与str.isdigit()等方法一致。
+_DIGIT = bytes(chr(i).isdigit() for i in range(256))
+_WORD = bytes(chr(i).isalnum() or chr(i) == "_" for i in range(256))
+_SPACE = bytes(chr(i).isspace() for i in range(256))
+_DOT = bytes(chr(i) not in "\r\n" for i in range(256))
+_NOTHING = bytes(256)  # 不匹配任何字符，用于未知的特殊字符
+_CLASS_TABLES = (_DIGIT, _WORD, _SPACE, _DOT, _NOTHING)
+# _CLASS_CODES[i][invert]为查找表_CLASS_TABLES[i]（invert为1时取反）匹配的ASCII码
+_CLASS_CODES = tuple(tuple(tuple(c for c in range(128) if table[c] != invert) for invert in (0, 1))
+                     for table in _CLASS_TABLES)
+# 特殊字符 -> (查找表, 是否取反)
+_SPECIAL_TABLES = {
+    "d": (_DIGIT, 0),
+    "w": (_WORD, 0),
+    "s": (_SPACE, 0),
+    "D": (_DIGIT, 1),
+    "W": (_WORD, 1),
+    "S": (_SPACE, 1),
+    ".": (_DOT, 0),
+}
+
+
+class RuleType(IntEnum):
     """
     用于表示状态转移的类型的枚举。
     示例用法： if rule.type == RuleType.EPSILON:
+    Rule的type属性实际存放的是下面的int常量NORMAL等；由于本类是IntEnum，上面的写法依然成立。
     """
     NORMAL = 0  # 一般转移。如 a
     RANGE = 1  # 字符区间转移。如 a-z
@@ -34,45 +65,61 @@ class RuleType(Enum):
     EPSILON = 3  # epsilon-转移。
 
 
+# 转移类型的int常量，与RuleType一一对应。int之间的比较比Enum的比较快得多。
+NORMAL = RuleType.NORMAL.value
+RANGE = RuleType.RANGE.value
+SPECIAL = RuleType.SPECIAL.value
+EPSILON = RuleType.EPSILON.value
+
+
 class Rule:
     """
     表示一条状态转移规则。
     """
     dst: int  # 目的状态
-    type: RuleType  # 状态转移的类型，详见RuleType的注释
+    type: int  # 状态转移的类型，取值为NORMAL、RANGE、SPECIAL或EPSILON，详见RuleType的注释
     by: str = ""  # 对特殊字符转移，这里只有一个字母，如d；对字符区间转移，这里是区间的开头，如a；对一般转移，这里就是转移所需的字母；对epsilon-转移，这里固定为空串。
     to: str = ""  # 对字符区间转移，这里是区间的结尾，如z；对任何其他类型的转移，这里固定为空串。
+    # 以下成员由_bind_codes根据type、by、to求出，供match_byte使用。NFA.compile会为每条规则调用_bind_codes。
+    _lo: int = -1  # 对一般转移和字符区间转移，这里是字母（区间开头）的编码
+    _hi: int = -1  # 对一般转移和字符区间转移，这里是字母（区间结尾）的编码
+    _match_table: Optional[bytes] = None  # 对特殊字符转移，这里是该类字符的查找表（见_SPECIAL_TABLES）
+    _invert: int = 0  # 对特殊字符转移，为1表示匹配查找表之外的字符，如\D
+
+    def _bind_codes(self):
+        """
+        求出match_byte用到的字母编码或查找表。
+        """
+        if self.type == NORMAL:
+            self._lo = self._hi = ord(self.by)
+        elif self.type == RANGE:
+            self._lo, self._hi = ord(self.by), ord(self.to)
+        elif self.type == SPECIAL:
+            # \d为[0-9]，\w为[A-Za-z0-9_]，\s为[ \f\n\r\t\v]，\D \W \S为它们的补集，\.匹配除换⾏符 \r \n 以外的任意单个字符。
+            # 未知的特殊字符不在这里报错，_match_table保持为None，直到真正调用match_byte时才报错。
+            self._match_table, self._invert = _SPECIAL_TABLES.get(self.by, (None, 0))
 
     def match(self, c: str) -> bool:
         """
         判断当前规则是否匹配指定的字符。
         """
-        if self.type == RuleType.NORMAL:
-            return self.by == c
-        elif self.type == RuleType.RANGE:
-            return ord(self.by) <= ord(c) <= ord(self.to)
-        elif self.type == RuleType.SPECIAL:
-            if self.by == "d":
-                # [0-9]
-                return c.isdigit()
-            elif self.by == "w":
-                # [A-Za-z0-9_]，即字母、数字、下划线
-                return c.isalnum() or c == "_"
-            elif self.by == "s":
-                # [ \f\n\r\t\v]
-                return c.isspace()
-            elif self.by == "D":
-                return not c.isdigit()
-            elif self.by == "W":
-                return not c.isalnum() and c != "_"
-            elif self.by == "S":
-                return not c.isspace()
-            elif self.by == ".":
-                # 匹配除换⾏符 \r \n 以外的任意单个字符。
-                return c != '\n' and c != '\r'
-            else:
-                raise ValueError("未知的特殊字符：" + self.by)
-        elif self.type == RuleType.EPSILON:
+        return self.match_byte(ord(c))
+
+    def match_byte(self, b: int) -> bool:
+        """
+        判断当前规则是否匹配编码为b的字符（如bytes中的一个元素）。
+        """
+        if self.type == NORMAL or self.type == RANGE:
+            if self._lo < 0:
+                self._bind_codes()
+            return self._lo <= b <= self._hi
+        elif self.type == SPECIAL:
+            if self._match_table is None:
+                self._bind_codes()
+                if self._match_table is None:
+                    raise ValueError("未知的特殊字符：" + self.by)
+            return self._match_table[b] != self._invert
+        elif self.type == EPSILON:
             raise ValueError("epsilon转移不应该调用match函数！")
         else:
             raise ValueError("未知的规则类型：" + str(self.type))
@@ -91,12 +138,137 @@ class Path:
         将Path转为（序列化为）文本的表达格式（以便于通过stdout输出）
         你不需要理解此函数的含义、阅读此函数的实现和调用此函数。
         """
-        result = ""
         if len(self.consumes) != len(self.states) - 1: raise AssertionError("Path的len(consumes)不等于len(states)-1！")
+        tokens = [str(self.states[0])]
         for i in range(len(self.consumes)):
-            result += str(self.states[i]) + " " + self.consumes[i] + " "
-        result += str(self.states[-1])
-        return result
+            tokens.append(self.consumes[i])
+            tokens.append(str(self.states[i + 1]))
+        return " ".join(tokens)
+
+
+# 以下两个函数是执行时的内层循环，只操作整数、bytes和列表，不访问任何对象属性。
+
+
+def _step_frontier(step_column: List[int], frontier: int) -> int:
+    """
+    求可达状态集合frontier读入某个字符后的可达状态集合。step_column[s]为状态s读入该字符后的可达状态集合。
+    """
+    next_frontier = 0
+    while frontier:
+        low = frontier & -frontier
+        next_frontier |= step_column[low.bit_length() - 1]
+        frontier ^= low
+    return next_frontier
+
+
+def _run_lazy_dfa(codes, length: int, frontier: int, steps: list, step_miss, cache: dict, cache_limit: int,
+                  accept_within: List[int]) -> Optional[List[int]]:
+    """
+    从可达状态集合frontier出发依次读入codes（如bytes）中的字符编码，codes的长度为length。
+    缓存未命中时调用steps[c](frontier)求下一集合；steps[c]为None时改为调用step_miss(c, frontier)。
+    每个位置上，若剩余k个字母且k < len(accept_within)，可达状态集合只保留accept_within[k]中的状态。
+    :return: 每个位置的可达状态集合组成的列表（长为length+1）；若中途可达状态集合为空，返回None。
+    """
+    horizon = len(accept_within)
+    remaining = length
+    if remaining < horizon:
+        frontier &= accept_within[remaining]
+    if not frontier:
+        return None
+    history = [0] * (length + 1)  # history[i]为位置i的可达状态集合，预先分配好，循环中只做下标赋值
+    history[0] = frontier
+    i = 0
+    for c in codes:
+        row = cache.get(frontier)
+        if row is None:
+            if len(cache) >= cache_limit:
+                cache.clear()
+            row = cache[frontier] = [-1] * 128
+        frontier = row[c]
+        if frontier == -1:
+            step = steps[c]
+            frontier = row[c] = step(history[i]) if step is not None else step_miss(c, history[i])
+        i += 1
+        remaining -= 1
+        if remaining < horizon:
+            frontier &= accept_within[remaining]
+        if not frontier:
+            return None
+        history[i] = frontier
+    return history
+
+
+def _tarjan_scc(adj: List[List[int]]) -> List[List[int]]:
+    """
+    用Tarjan算法求有向图的强连通分量。adj[v]为v的后继列表。
+    :return: 强连通分量的列表，按逆拓扑序排列（即分量的后继分量总在它之前）。
+    """
+    n = len(adj)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    counter = 0
+    components = []
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]  # 用显式栈代替递归：(状态, 下一条待访问出边的下标)
+        while work:
+            v, k = work[-1]
+            if k == 0:
+                index[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            if k < len(adj[v]):
+                work[-1] = (v, k + 1)
+                w = adj[v][k]
+                if index[w] == -1:
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+                continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                components.append(component)
+    return components
+
+
+def _char_class(codes: List[int]) -> str:
+    """
+    把一组（升序的）字符编码写成正则表达式中的一个字符或字符类，字符一律以\\xHH的形式转义。
+    """
+    if len(codes) == 1:
+        return "\\x%02x" % codes[0]
+    parts = []
+    start = prev = codes[0]
+    for c in codes[1:] + [-1]:
+        if c == prev + 1:
+            prev = c
+            continue
+        parts.append("\\x%02x" % start if start == prev else "\\x%02x-\\x%02x" % (start, prev))
+        start = prev = c
+    return "[" + "".join(parts) + "]"
+
+
+def _regex_star(expr: str) -> str:
+    """
+    正则表达式expr的Kleene闭包。单个字符或字符类直接加*，否则先加上非捕获组。
+    """
+    if re.fullmatch(r"\\x[0-9a-f]{2}|\[[^\]]*\]", expr):
+        return expr + "*"
+    return "(?:" + expr + ")*"
 
 
 class NFA:
@@ -105,65 +277,456 @@ class NFA:
     本类定义的自动机，约定状态用编号0~(num_states-1)表示，初态固定为0。
     """
     num_states: int = 0  # 状态个数
-    is_final: List[bool] = []  # 用于判断状态是否为终态的数组，长为num_states。is_final[i]为true表示状态i为终态。
+    is_final: bytes = b""  # 用于判断状态是否为终态的数组，长为num_states。is_final[i]非0表示状态i为终态。
     rules: List[List[Rule]] = []  # 表示所有状态转移规则的二维数组，长为num_states。rules[i]表示从状态i出发的所有转移规则。
+    eps_closure: List[frozenset] = []  # 每个状态的ε闭包，长为num_states。在from_text结束时预先求出。
+    _compiled: bool = False  # 是否已经由compile求出了eps_closure及以下的预计算表；尚未求出时，exec会先调用compile
+    # 以下是rules按字段拆开的扁平数组（CSR格式）：从状态s出发的规则的下标为rule_offsets[s]到rule_offsets[s+1]-1。
+    rule_offsets: array = array("i")
+    rule_dst: array = array("i")  # 目的状态
+    rule_kind: array = array("i")  # 转移的类型，即Rule的type
+    rule_lo: array = array("i")  # 一般转移和区间转移：字母（区间开头）的编码；特殊转移：_CLASS_TABLES中查找表的下标
+    rule_hi: array = array("i")  # 一般转移和区间转移：字母（区间结尾）的编码；特殊转移：是否取反
+    # 以下是按类型划分后的转移，同样在from_text结束时求出。
+    eps_dst: List[tuple] = []  # eps_dst[s]为从状态s出发经一次ε转移能到达的状态
+    consume_dst: List[tuple] = []  # consume_dst[s]为从状态s出发、消耗某个ASCII字符能到达的状态
+    # byte_dst[c][s]为从状态s出发、消耗ASCII码为c的字符能到达的状态。执行时第一次读入c才由_fill_byte求出，此前byte_dst[c]为None。
+    byte_dst: List[Optional[List[tuple]]] = []
+    min_consume: List[int] = []  # min_consume[s]为从状态s到达终态至少要消耗的字母数，-1表示无法到达终态
+    _max_accept_len: Optional[int] = None  # 能被接受的输入串的最大长度，None表示无上界，-1表示不接受任何输入串
+    _accept_within: List[int] = []  # 见_build_masks
+    # 以下是用int作位集合（第i位为1表示包含状态i）的预计算表，同样在from_text结束时求出。
+    final_mask: int = 0  # 所有终态
+    eps_closure_mask: List[int] = []  # eps_closure的位掩码形式
+    # step_mask[c][s]为状态s消耗ASCII码为c的字符后，再经ε闭包能到达的状态（只保留有用的状态），与byte_dst[c]一同求出
+    step_mask: List[Optional[List[int]]] = []
+    _keep_mask: int = 0  # 可达状态集合中需要保留的状态，见_build_masks
+    _start_mask: int = 0  # 初始的可达状态集合，即初态的ε闭包中有用的状态
+    # 惰性构造的DFA：把出现过的可达状态集合当作DFA状态，_dfa_cache[集合][c]缓存其读入c后的集合（-1表示尚未求出）。
+    _dfa_cache: dict = {}
+    _DFA_CACHE_LIMIT = 4096  # 缓存的DFA状态数超过该值时清空重来，避免内存无限增长
+    _step_fns: list = []  # 单步转移函数，见_compile_specialized
+    _step_misses: List[int] = []  # _step_misses[c]为读入ASCII码为c的字符时未命中_dfa_cache的次数
+    _specialized: dict = {}  # 已生成的单步转移函数，键为函数体
+    _SPECIALIZE_LIMIT = 256  # 状态数不超过该值时才生成专用的单步转移函数
+    _SPECIALIZE_AFTER = 32  # 某个字符未命中_dfa_cache达到该次数时才为它生成专用的单步转移函数
+    _regex: Optional[re.Pattern] = None  # 与自动机等价的正则表达式，见try_to_regex
+    _regex_tried: bool = False  # 是否已经尝试过求出_regex。只有exec遇到不短于_REGEX_MIN_INPUT的输入串时才会尝试
+    _REGEX_MIN_INPUT = 16384  # 输入串不短于该长度时才用正则表达式判断是否接受；较短的输入串省下的时间抵不上转换和编译正则表达式的开销
+    _REGEX_STATE_LIMIT = 256  # 从初态可达、且能到达终态的状态数的上限，超过时不转换为正则表达式
+    _REGEX_SIZE_LIMIT = 4096  # 转换得到的正则表达式的最大长度
 
     # 用于回溯路径
-    def backtrace(self, path: dict) -> Path:
+    def backtrace(self, text: str, history: List[int], final_state: int) -> Path:
         """
         用于回溯路径
-        :param path: 保存每一步的状态和剩余输入串
+        :param text: 输入字符串
+        :param history: history[i]为读入前i个字母后可达状态集合的位掩码，长为len(text)+1
+        :param final_state: 读完输入串后所处的终态
         :return: 返回找到的路径
         """
-        states = []
+        pos = len(text)
+        q = final_state
+        closure_mask = self.eps_closure_mask
+        states = [q]
         consumes = []
-        step = max(path.keys())
-        
-        for i in range(step, 0, -1):
-            states.append(path[i][0])
-            if path[i][1] == path[i - 1][1]:
-                consumes.append("")
+        while True:
+            if pos == 0:
+                entry = 0
             else:
-                consumes.append(path[i - 1][1][0])
-        states.append(0)
+                # 在前一位置找一个状态p，使得p消耗text[pos-1]到达的某个状态d的ε闭包包含q
+                c = ord(text[pos - 1])
+                if self.byte_dst[c] is None:
+                    self._fill_byte(c)
+                byte_dst = self.byte_dst[c]
+                prev = history[pos - 1]  # 只逐位遍历前一位置的可达状态集合，不扫描全部状态
+                entry = -1
+                while entry == -1 and prev:
+                    low = prev & -prev
+                    p = low.bit_length() - 1
+                    for d in byte_dst[p]:
+                        if (closure_mask[d] >> q) & 1:
+                            entry = d
+                            break
+                    prev ^= low
+            for s in reversed(self._eps_path(entry, q)[:-1]):
+                states.append(s)
+                consumes.append("")
+            if pos == 0:
+                break
+            pos -= 1
+            q = p
+            states.append(q)
+            consumes.append(text[pos])
         path = Path()
         path.states = states[::-1]
         path.consumes = consumes[::-1]
         return path
 
+    def _eps_path(self, src: int, dst: int) -> List[int]:
+        """
+        在ε转移上广度优先搜索，返回从src到dst的状态序列（含两端）。
+        """
+        if src == dst:
+            return [src]
+        prev = {src: src}  # prev[t]为BFS中到达t的前一状态，只记录搜索到的状态
+        queue = [src]
+        for q in queue:
+            if q == dst:
+                break
+            for t in self.eps_dst[q]:
+                if t not in prev:
+                    prev[t] = q
+                    queue.append(t)
+        seq = [dst]
+        while seq[-1] != src:
+            seq.append(prev[seq[-1]])
+        return seq[::-1]
+
+    def _build_eps_closure(self):
+        """
+        预先求出每个状态的ε闭包。
+        先求ε转移图的强连通分量（ε环会缩成一个分量），分量按逆拓扑序产生，
+        因此每个分量的闭包只需合并其出边指向的、已经求好的分量的闭包。
+        """
+        closure = [None] * self.num_states
+        for component in _tarjan_scc(self.eps_dst):
+            clo = set(component)
+            for s in component:
+                for t in self.eps_dst[s]:
+                    if closure[t] is not None:
+                        clo |= closure[t]
+            clo = frozenset(clo)
+            for s in component:
+                closure[s] = clo
+        self.eps_closure = closure
+
+    def _build_accept_bounds(self):
+        """
+        求出min_consume和_max_accept_len。
+        min_consume[s]：在反向图上从所有终态出发做0-1 BFS（ε转移边权为0，消耗字母的转移边权为1）。
+        _max_accept_len：在能到达终态的状态构成的子图上求强连通分量，若从初态能到达某个内部含有消耗字母的转移的分量，
+        则可接受的输入串长度无上界；否则沿逆拓扑序求最长路。
+        """
+        n = self.num_states
+        consume_dst = self.consume_dst
+        reverse = [[] for _ in range(n)]  # reverse[t]为(s, 边权)的列表，表示s到t的一条转移
+        for s in range(n):
+            for t in self.eps_dst[s]:
+                reverse[t].append((s, 0))
+            for t in consume_dst[s]:
+                reverse[t].append((s, 1))
+        dist = [-1] * n
+        queue = deque()
+        for s in range(n):
+            if self.is_final[s]:
+                dist[s] = 0
+                queue.append(s)
+        while queue:
+            t = queue.popleft()
+            for s, w in reverse[t]:
+                d = dist[t] + w
+                if dist[s] == -1 or d < dist[s]:
+                    dist[s] = d
+                    if w == 0:
+                        queue.appendleft(s)
+                    else:
+                        queue.append(s)
+        self.min_consume = dist
+
+        if dist[0] == -1:
+            self._max_accept_len = -1
+            return
+        # 只保留能到达终态的状态之间的转移
+        eps_adj = [[t for t in self.eps_dst[s] if dist[t] != -1] for s in range(n)]
+        consume_adj = [[t for t in consume_dst[s] if dist[t] != -1] for s in range(n)]
+        components = _tarjan_scc([eps_adj[s] + consume_adj[s] for s in range(n)])
+        component_of = [0] * n
+        for i, component in enumerate(components):
+            for s in component:
+                component_of[s] = i
+        longest = []  # longest[i]为从分量i出发到达终态最多消耗的字母数，None表示无上界
+        for i, component in enumerate(components):
+            best = 0 if any(self.is_final[s] for s in component) else -1
+            for s in component:
+                for edges, w in ((eps_adj[s], 0), (consume_adj[s], 1)):
+                    for t in edges:
+                        j = component_of[t]
+                        if j == i:
+                            if w:
+                                best = None
+                        elif best is not None:
+                            best = None if longest[j] is None else max(best, longest[j] + w)
+            longest.append(best)
+        self._max_accept_len = longest[component_of[0]]
+
+    def _build_flat_rules(self):
+        """
+        把rules拆成按字段存放的扁平数组（见rule_offsets等成员的注释），此后的预计算都基于这些数组而不再访问Rule对象。
+        """
+        offsets, dst, kind, lo, hi = array("i", [0]), array("i"), array("i"), array("i"), array("i")
+        for rules in self.rules:
+            for rule in rules:
+                dst.append(rule.dst)
+                kind.append(rule.type)
+                rule._bind_codes()
+                if rule.type == NORMAL or rule.type == RANGE:
+                    lo.append(rule._lo)
+                    hi.append(rule._hi)
+                elif rule.type == SPECIAL:
+                    # 未知的特殊字符在预计算表中视为不匹配任何字符
+                    lo.append(_CLASS_TABLES.index(_NOTHING if rule._match_table is None else rule._match_table))
+                    hi.append(rule._invert)
+                else:
+                    lo.append(0)
+                    hi.append(0)
+            offsets.append(len(dst))
+        self.rule_offsets, self.rule_dst, self.rule_kind, self.rule_lo, self.rule_hi = offsets, dst, kind, lo, hi
+
+    def _partition_rules(self):
+        """
+        按类型划分每个状态的转移：ε转移放入eps_dst，至少匹配一个ASCII字符的转移放入consume_dst。
+        按所匹配的ASCII码展开的byte_dst和step_mask留到执行时逐个字符求出（见_fill_byte），
+        一次执行通常只会读到少数几种字符，不必在构造时展开全部128个ASCII码。
+        """
+        self.eps_dst = []
+        self.consume_dst = []
+        for s in range(self.num_states):
+            eps = []
+            consume = []
+            for i in range(self.rule_offsets[s], self.rule_offsets[s + 1]):
+                kind, lo, hi = self.rule_kind[i], self.rule_lo[i], self.rule_hi[i]
+                if kind == EPSILON:
+                    eps.append(self.rule_dst[i])
+                elif _CLASS_CODES[lo][hi] if kind == SPECIAL else lo <= min(hi, 127):
+                    consume.append(self.rule_dst[i])
+            self.eps_dst.append(tuple(dict.fromkeys(eps)))
+            self.consume_dst.append(tuple(dict.fromkeys(consume)))
+        self.byte_dst = [None] * 128
+        self.step_mask = [None] * 128
+
+    def _fill_byte(self, c: int):
+        """
+        求出byte_dst[c]和step_mask[c]：逐条检查有消耗字母的转移的状态的规则，看其是否匹配ASCII码c，
+        这样执行时只需查表，不必逐条判断规则类型、调用Rule.match。
+        """
+        offsets, dst, kind, lo, hi = self.rule_offsets, self.rule_dst, self.rule_kind, self.rule_lo, self.rule_hi
+        byte_row = [()] * self.num_states
+        step_row = [0] * self.num_states
+        for s in range(self.num_states):
+            if not self.consume_dst[s]:
+                continue
+            dsts = [dst[i] for i in range(offsets[s], offsets[s + 1])
+                    if (_CLASS_TABLES[lo[i]][c] != hi[i] if kind[i] == SPECIAL else kind[i] != EPSILON and lo[i] <= c <= hi[i])]
+            if dsts:
+                byte_row[s] = tuple(dict.fromkeys(dsts))
+                mask = 0
+                for t in byte_row[s]:
+                    mask |= self.eps_closure_mask[t]
+                step_row[s] = mask & self._keep_mask
+        self.byte_dst[c] = byte_row
+        self.step_mask[c] = step_row
+
+    def _build_masks(self):
+        """
+        求出终态和ε闭包的位掩码形式，使执行时的集合运算变成整数的按位或；单步转移的位掩码step_mask由_fill_byte按字符求出。
+        可达状态集合只保留可能影响结果的状态，即能到达终态、并且自身是终态或有消耗字母的转移的状态：
+        可达状态集合已经是ε闭包，既不是终态又没有消耗字母的转移的状态只是ε转移的中转站，不会再贡献任何新状态。
+        """
+        n = self.num_states
+        live_mask = sum(1 << s for s in range(n) if self.min_consume[s] != -1)
+        consume_mask = sum(1 << s for s in range(n) if self.consume_dst[s])
+        self.final_mask = sum(1 << s for s in range(n) if self.is_final[s])
+        self._keep_mask = live_mask & (consume_mask | self.final_mask)
+        self.eps_closure_mask = [sum(1 << t for t in clo) for clo in self.eps_closure]
+        self._start_mask = self.eps_closure_mask[0] & self._keep_mask
+        # _accept_within[k]为至多再消耗k个字母就能到达终态的状态；k不小于其长度时，所有能到达终态的状态都满足
+        # 先按min_consume把状态分桶，再对各桶依次求前缀的按位或
+        horizon = max(self.min_consume, default=0)
+        buckets = [0] * horizon  # buckets[k]为min_consume恰为k的状态
+        for s in range(n):
+            if 0 <= self.min_consume[s] < horizon:
+                buckets[self.min_consume[s]] |= 1 << s
+        self._accept_within = []
+        mask = 0
+        for bucket in buckets:
+            mask |= bucket
+            self._accept_within.append(mask)
+        self._dfa_cache = {}
+
+    def compile(self):
+        """
+        由rules求出执行时用到的全部预计算表。from_text结束时会自动调用；手工构造的自动机会在第一次exec时自动调用。
+        若compile之后又修改了num_states、is_final或rules，需要重新调用。
+        """
+        self._compiled = True
+        self._build_flat_rules()
+        self._partition_rules()
+        self._build_eps_closure()
+        self._build_accept_bounds()
+        self._build_masks()
+        self._compile_specialized()
+        self._regex = None
+        self._regex_tried = False
+
+    def try_to_regex(self) -> Optional[str]:
+        """
+        尝试把自动机转换为与之等价的Python正则表达式（用于re.fullmatch，按ASCII字节匹配）。
+        只处理确定性的自动机，即从初态可达、且能到达终态的状态之间没有ε转移，每个状态读入每个字母至多到达一个状态：
+        由非确定的自动机得到的正则表达式可能有歧义，re的回溯匹配在这种表达式上可能退化成指数时间。
+        转换用状态消去法，每次消去入边数乘出边数最小的状态。
+        从初态可达、且能到达终态的状态超过_REGEX_STATE_LIMIT个，或任何一个中间表达式的长度超过_REGEX_SIZE_LIMIT时放弃。
+        :return: 正则表达式；若不满足上述条件，返回None。
+        """
+        live = [d != -1 for d in self.min_consume]
+        if not live[0]:
+            return "(?!)"  # 不接受任何输入串
+        # 收集从初态可达、且能到达终态的状态之间的转移：edges[(src, dst)]为所消耗字母的编码列表
+        edges = {}
+        nodes = set()
+        stack = [0]
+        while stack:
+            s = stack.pop()
+            if s in nodes:
+                continue
+            nodes.add(s)
+            if len(nodes) > self._REGEX_STATE_LIMIT or any(live[t] for t in self.eps_dst[s]):
+                return None
+            targets = {}  # 字符编码 -> 读入该字符到达的状态
+            for i in range(self.rule_offsets[s], self.rule_offsets[s + 1]):
+                kind, lo, hi, t = self.rule_kind[i], self.rule_lo[i], self.rule_hi[i], self.rule_dst[i]
+                if kind == EPSILON or not live[t]:
+                    continue
+                for c in _CLASS_CODES[lo][hi] if kind == SPECIAL else range(lo, min(hi, 127) + 1):
+                    if targets.setdefault(c, t) != t:
+                        return None
+            for c in sorted(targets):
+                edges.setdefault((s, targets[c]), []).append(c)
+                stack.append(targets[c])
+
+        start, end = self.num_states, self.num_states + 1  # 新增的初态和终态，分别用ε转移连到原初态和原终态
+        out_edges = {s: {} for s in nodes | {start, end}}
+        in_edges = {s: {} for s in nodes | {start, end}}
+
+        def add(src: int, dst: int, expr: str) -> bool:
+            """
+            添加一条src到dst的边，已有边时与之取并；表达式长度超过_REGEX_SIZE_LIMIT时不添加，返回False。
+            """
+            if dst in out_edges[src]:
+                expr = "(?:" + out_edges[src][dst] + "|" + expr + ")"
+            if len(expr) > self._REGEX_SIZE_LIMIT:
+                return False
+            out_edges[src][dst] = in_edges[dst][src] = expr
+            return True
+
+        add(start, 0, "")
+        for s in nodes:
+            if self.is_final[s]:
+                add(s, end, "")
+        for (src, dst), codes in edges.items():
+            if not add(src, dst, _char_class(codes)):
+                return None
+        remaining = set(nodes)
+        while remaining:
+            k = min(remaining, key=lambda q: len(in_edges[q]) * len(out_edges[q]))
+            remaining.remove(k)
+            loop = out_edges[k].pop(k, None)
+            in_edges[k].pop(k, None)
+            star = "" if loop is None else _regex_star(loop)
+            for i, before in in_edges[k].items():
+                del out_edges[i][k]
+                for j, after in out_edges[k].items():
+                    if not add(i, j, before + star + after):
+                        return None
+            for j in out_edges[k]:
+                del in_edges[j][k]
+            del out_edges[k], in_edges[k]
+        return out_edges[start].get(end, "(?!)")
+
+    def _compile_specialized(self):
+        """
+        准备单步转移函数：_step_fns[c](frontier)为frontier读入ASCII码为c的字符后的可达状态集合。
+        _step_fns[c]一开始为None，由_specialize_step代为求出下一集合，并在适当的时候填入专用的函数。
+        """
+        self._specialized = {}
+        self._step_fns = [None] * 128
+        self._step_misses = [0] * 128
+
+    def _specialize_step(self, c: int, frontier: int) -> int:
+        """
+        求出frontier读入ASCII码为c的字符后的可达状态集合，还没有求出step_mask[c]时先求出它。
+        字符c第_SPECIALIZE_AFTER次未命中_dfa_cache时生成它专用的单步转移函数，填入_step_fns[c]：生成和编译代码的开销
+        只有在转移被反复求值时才能收回，此前使用通用的_step_frontier。状态数超过_SPECIALIZE_LIMIT时生成的代码过长，
+        直接把通用的_step_frontier填入_step_fns[c]。
+        生成的函数只检查在字符c上有转移的状态，位掩码都作为常量写进代码，省去逐位遍历frontier的循环；
+        函数体相同的字符共用同一个函数。
+        """
+        if self.step_mask[c] is None:
+            self._fill_byte(c)
+        column = self.step_mask[c]
+        self._step_misses[c] += 1
+        if self.num_states > self._SPECIALIZE_LIMIT:
+            fn = partial(_step_frontier, column)
+        elif self._step_misses[c] < self._SPECIALIZE_AFTER:
+            return _step_frontier(column, frontier)
+        else:
+            body = "".join("    if frontier & %d:\n        next_frontier |= %d\n" % (1 << s, column[s])
+                           for s in range(self.num_states) if column[s])
+            fn = self._specialized.get(body)
+            if fn is None:
+                source = "def step(frontier):\n    next_frontier = 0\n%s    return next_frontier\n" % body
+                namespace = {}
+                exec(compile(source, "<nfa>", "exec"), namespace)
+                fn = self._specialized[body] = namespace["step"]
+        self._step_fns[c] = fn
+        return fn(frontier)
+
     def exec(self, text: str) -> Optional[Path]:
         """
         在自动机上执行指定的输入字符串。
         :param text: 输入字符串
         :return: 若拒绝，返回None。若接受，返回一个Path类的对象。
-        
-         
-        """
-        stack = [(0, text, 0)]  # 初始化栈，包含起始状态、完整输入字符串和初始步数
-        path = {}  # 用于记录每一步的状态和剩余输入串
-        visited = set()  # 用于记录已经访问过的状态和对应的剩余输入字符串组合
-
-        # TODO ε转移需要避免循环，所以需要判断是否已经走过这个状态
-        while stack:  # 循环直到栈为空
-            q, remaining_str, step = stack.pop()  # 从栈中取出一个元素
-            path[step] = (q, remaining_str)  # 记录当前步骤的状态和剩余的输入字符串
 
-            if self.is_final[q] and not remaining_str:  # 如果当前状态是终态且剩余输入字符串为空
-                return self.backtrace(path)  # 调用backtrace函数返回找到的路径
-
-            for rule in reversed(self.rules[q]):  # 遍历当前状态的所有转移规则
-                next_state = (rule.dst, remaining_str)  # 下一个状态和剩余输入字符串
-                if rule.type == RuleType.EPSILON:  # 如果是ε转移
-                    if next_state not in visited:
-                        stack.append((rule.dst, remaining_str, step + 1))  # 目标状态、剩余输入字符串、步数+1
-                        visited.add(next_state)  # 标记为已访问
-                elif remaining_str and rule.match(remaining_str[0]):  # 如果规则与当前输入字符串的第一个字符匹配
-                    stack.append((rule.dst, remaining_str[1:], step + 1))  # 目标状态、去掉第一个字符的剩余输入字符串、步数+1
+        可达状态集合用int作位掩码表示，每读入一个字母，把集合中每个状态的step_mask按位或起来即得下一集合。
+        求得的转移会缓存在_dfa_cache中，同一集合再次读入同一字母时直接查表。
+        剩余的字母不足以让某个状态到达终态时（见min_consume），该状态会被直接剪掉；输入串超过可接受的最大长度时直接拒绝。
+        输入串不短于_REGEX_MIN_INPUT、且自动机可以转换为正则表达式时（见try_to_regex，第一次遇到这样的输入串时才转换），
+        先用re判断是否接受，只有接受时才需要模拟自动机以求出路径。
+        """
+        if not self._compiled:
+            self.compile()
+        if self._max_accept_len is not None and len(text) > self._max_accept_len:
+            return None
+        buf = text.encode("ascii")  # 输入串保证仅含ASCII字符，每个字符恰好对应一个字节
+        if len(buf) >= self._REGEX_MIN_INPUT:
+            if not self._regex_tried:
+                self._regex_tried = True
+                pattern = self.try_to_regex()
+                self._regex = None if pattern is None else re.compile(pattern.encode("ascii"))
+            if self._regex is not None and self._regex.fullmatch(buf) is None:
+                return None
+        history = _run_lazy_dfa(buf, len(buf), self._start_mask, self._step_fns, self._specialize_step,
+                                self._dfa_cache, self._DFA_CACHE_LIMIT, self._accept_within)
+        if history is None:
+            return None
+        accept = history[-1] & self.final_mask
+        if accept:
+            return self.backtrace(text, history, (accept & -accept).bit_length() - 1)
+        return None  # 中途没有可达状态，或走完输入串后没有到达终态，拒绝
 
-        return None  # 如果循环结束仍未找到接受的路径，则返回None
+    def __getstate__(self) -> dict:
+        """
+        序列化时不保存惰性DFA的缓存和生成的单步转移函数（函数无法被pickle），它们在反序列化后重新准备。
+        """
+        state = self.__dict__.copy()
+        for key in ("_dfa_cache", "_step_fns", "_step_misses", "_specialized"):
+            state.pop(key, None)
+        return state
 
-        
-        
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._dfa_cache = {}
+        self._compile_specialized()
 
     @staticmethod
     def from_text(text: str) -> "NFA":
@@ -183,7 +746,7 @@ class NFA:
             if type != "nfa": raise ValueError("输入文件的类型不是nfa！")
             if line.startswith("states:"):
                 nfa.num_states = int(line[7:])
-                nfa.is_final = [False for _ in range(nfa.num_states)]
+                nfa.is_final = bytearray(nfa.num_states)
                 nfa.rules = [[] for _ in range(nfa.num_states)]
                 continue
             elif line.startswith("final:"):
@@ -191,7 +754,7 @@ class NFA:
                 content = line[6:].strip()
                 for s in content.split(" "):
                     if s == "": continue
-                    nfa.is_final[int(s)] = True
+                    nfa.is_final[int(s)] = 1
                 reading_rules = False
                 continue
             elif line.startswith("rules:"):
@@ -202,43 +765,78 @@ class NFA:
                 reading_rules = False
                 continue
             elif reading_rules:
-                arrow_pos = line.find("->")
-                space_pos = line.find(" ")
-                if arrow_pos != -1 and space_pos != -1 and arrow_pos < space_pos:
-                    src = int(line[0:arrow_pos])
-                    dst = int(line[arrow_pos + 2:space_pos])
-                    content = line[space_pos + 1:]
-                    success = True
-                    while success and content != "":
-                        p = content.find(" ")
-                        if p == -1:
-                            p = len(content)
-                        elif p == 0:
-                            p = 1  # 当第一个字母是空格时，说明转移的字符就是空格。于是假定第二个字母也是空格（如果不是，会在后面直接报错）
+                m = _RULE_RE.fullmatch(line)
+                if m is not None:
+                    src = int(m.group(1))
+                    dst = int(m.group(2))
+                    content = m.group(3)
+                    pos = 0
+                    for token in _TOKEN_RE.finditer(content):
+                        if token.start() != pos:
+                            break  # 中间有无法识别的部分，这一行余下的内容不再解析
+                        pos = token.end()
                         rule = Rule()
                         rule.dst = dst
-                        if p == 3 and content[1] == '-':
-                            rule.type = RuleType.RANGE
-                            rule.by = content[0]
-                            rule.to = content[2]
-                        elif p == 2 and content[0] == "\\":
-                            if content[1] == "e":
-                                rule.type = RuleType.EPSILON
+                        kind = token.lastindex
+                        if kind == 1:
+                            if token.group(1) == "e":
+                                rule.type = EPSILON
                             else:
-                                rule.type = RuleType.SPECIAL
-                                rule.by = content[1]
-                        elif p == 1 and (p >= len(content) or content[p] == ' '):
-                            rule.type = RuleType.NORMAL
-                            rule.by = content[0]
+                                rule.type = SPECIAL
+                                rule.by = token.group(1)
+                        elif kind == 3:
+                            rule.type = RANGE
+                            rule.by = token.group(2)
+                            rule.to = token.group(3)
                         else:
-                            success = False
+                            rule.type = NORMAL
+                            rule.by = token.group(4)
                         nfa.rules[src].append(rule)
-                        content = content[p + 1:]
-                    if success:
-                        continue
+                    continue
+        nfa.is_final = bytes(nfa.is_final)
+        nfa.compile()
         return nfa
 
 
+def load_nfa_cached(text: str, cache_dir: str) -> NFA:
+    """
+    与NFA.from_text相同，但会把构造好的自动机（含全部预计算表）缓存到cache_dir下，反复执行同一个自动机时省去解析和预计算。
+    缓存的键是本文件的内容和自动机的文本表示（其中input:行只保留前缀，输入串不同的文件共用同一份缓存）的blake2b哈希。
+    缓存无法读写时直接重新构造。缓存文件不会被自动清理。
+    仅当自动机很大、构造耗时明显超过导入pickle和hashlib的开销（约十几毫秒）时才值得使用。
+    """
+    import hashlib
+    import pickle
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(__file__, "rb") as f:
+        digest.update(f.read())
+    for line in text.splitlines():
+        digest.update(b"input:\n" if line.startswith("input:") else line.encode() + b"\n")
+    path = os.path.join(cache_dir, digest.hexdigest() + ".pkl")
+    try:
+        with open(path, "rb") as f:
+            nfa = pickle.load(f)
+        if isinstance(nfa, NFA):
+            return nfa
+    except Exception:
+        # 缓存文件损坏、或是由以其他模块名导入的本文件写入的（反序列化时找不到该模块）等，一律当作未命中，下面会覆盖它
+        pass
+    nfa = NFA.from_text(text)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(nfa, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return nfa
+
+
 if __name__ == '__main__':
     """
     程序入口点函数。已经帮你封装好了读取文本输入、构造自动机并执行字符串、输出结果等。
@@ -257,7 +855,9 @@ if __name__ == '__main__':
     if input_str is None:
         raise ValueError("未找到输入字符串！注意输入字符串必须以input: 开头，其中冒号后面必须有空格！")
 
-    nfa = NFA.from_text(text)
+    # 设置了环境变量NFA_CACHE_DIR时，把构造好的自动机缓存到该目录下（见load_nfa_cached）；默认不使用缓存
+    cache_dir = os.environ.get("NFA_CACHE_DIR")
+    nfa = NFA.from_text(text) if not cache_dir else load_nfa_cached(text, cache_dir)
     result = nfa.exec(input_str)
     if result is None:
         print("Reject", end='')